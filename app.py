@@ -1,39 +1,108 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from recommender import PureSVDRecommender
+from functools import lru_cache
+from recommender import BACKENDS
+import numpy as np
+import orjson
+import os
 import time
 
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(JSONProvider):
+    """Routes jsonify / request.get_json through orjson instead of the stdlib json module."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=ORJSON_OPTIONS), mimetype="application/json")
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # ── Initialize recommender ────────────────────────────
-print("🔁 Initializing Pure SVD Recommender …")
-rec = PureSVDRecommender(sample_users=5000, sample_movies=5000)
-print("✅ PureSVD ready")
+BACKEND = os.getenv("BACKEND", "svd").strip().lower()
+if BACKEND not in BACKENDS:
+    raise SystemExit(f"❌ Unknown BACKEND '{BACKEND}', expected one of: {', '.join(BACKENDS)}")
+
+print(f"🔁 Initializing {BACKEND} recommender …")
+rec = BACKENDS[BACKEND](sample_users=5000, sample_movies=5000)
+print("✅ Recommender ready")
 
 
 # ── Helper functions ──────────────────────────────────
-def apply_filters(movies, genre_q, year_q, title_q):
+# Movies are addressed by their position in the recommender's catalog arrays;
+# filters and sorts work on those positions and only the final page is turned into dicts.
+def year_prefix_mask(years, year_q):
+    # Integer form of str(year).startswith(year_q) for four-digit years
+    if not year_q.isdecimal() or len(year_q) > 4:
+        return np.zeros(len(years), dtype=bool)
+    return years // 10 ** (4 - len(year_q)) == int(year_q)
+
+def apply_filters(positions, genre_q, year_q, title_q):
+    # Narrow step by step, cheapest test first; when few rows survive, the
+    # string tests only look at those rows instead of the whole catalog
+    if year_q:
+        positions = positions[year_prefix_mask(rec.years[positions], year_q)]
     if title_q:
-        movies = [m for m in movies if title_q in m["title"].lower()]
+        positions = rec.title_search.contains(title_q, positions)
     if genre_q:
-        movies = [m for m in movies if genre_q in m.get("genres", "").lower()]
-    if year_q:
-        try:
-            movies = [m for m in movies if str(m["year"]).startswith(str(year_q))]
-        except Exception:
-            pass
-    return movies
-
-def apply_sorting(movies, sort_by, order):
-    reverse = order == "desc"
-    if sort_by == "rating":
-        movies.sort(key=lambda m: m.get("avgRating", 0), reverse=reverse)
-    elif sort_by == "year":
-        movies.sort(key=lambda m: int(m.get("year", 0)), reverse=reverse)
-    elif sort_by == "title":
-        movies.sort(key=lambda m: m["title"].lower(), reverse=reverse)
-    return movies
+        positions = rec.genre_search.contains(genre_q, positions)
+    return positions
+
+def apply_sorting(positions, sort_by, order):
+    key = (sort_by, "desc" if order == "desc" else "asc")
+    if key not in rec.sort_perms:
+        return positions
+    perm = rec.sort_perms[key]
+    if len(positions) * 8 < len(perm):
+        # Small selections (samples, narrow searches): order just those rows by precomputed rank
+        return positions[np.argsort(rec.sort_ranks[key][positions])]
+    # Otherwise walk the precomputed order once and keep the selected rows
+    selected = np.zeros(len(perm), dtype=bool)
+    selected[positions] = True
+    return perm[selected[perm]]
+
+# Keyed on the filter set only (no page), so one entry serves every page of a result list
+@lru_cache(maxsize=256)
+def filter_sort_perm(sample_param, title_q, genre_q, year_q, sort_by, order):
+    # Get base movie list
+    if sample_param == "all":
+        positions = rec.all_positions()
+    else:
+        sample_size = int(sample_param)
+        positions = rec.sample_positions(sample_size)
+
+    # Apply filters and sorting
+    positions = apply_filters(positions, genre_q, year_q, title_q)
+    positions = apply_sorting(positions, sort_by, order)
+    positions.flags.writeable = False  # shared by every later hit
+    return positions
+
+def build_page(sample_param, title_q, genre_q, year_q, sort_by, order, page, per_page):
+    positions = filter_sort_perm(sample_param, title_q, genre_q, year_q, sort_by, order)
+
+    # Pagination
+    total = len(positions)
+    start = (page - 1) * per_page
+    end = start + per_page
+    return rec.page(positions, start, end), total
+
+@lru_cache(maxsize=1024)
+def unfiltered_page(sample_param, sort_by, order, page, per_page):
+    # Browse pages without search filters are the common case and never change for the
+    # lifetime of `rec`, so keep them pre-serialized and splice the bytes into the response.
+    page_items, total = build_page(sample_param, "", "", "", sort_by, order, page, per_page)
+    return orjson.Fragment(orjson.dumps(page_items, option=ORJSON_OPTIONS)), total
 
 # ── Routes ─────────────────────────────────────────────
 @app.route("/api/movies", methods=["GET"])
@@ -49,22 +118,10 @@ def get_movies():
     sort_by = request.args.get("sort", "rating").strip().lower()
     order = request.args.get("order", "desc").strip().lower()
 
-    # Get base movie list
-    if sample_param == "all":
-        movies = rec.all_movies()
+    if title_q or genre_q or year_q:
+        page_items, total = build_page(sample_param, title_q, genre_q, year_q, sort_by, order, page, per_page)
     else:
-        sample_size = int(sample_param)
-        movies = rec.sample_movies(sample_size)
-
-    # Apply filters and sorting
-    movies = apply_filters(movies, genre_q, year_q, title_q)
-    movies = apply_sorting(movies, sort_by, order)
-
-    # Pagination
-    total = len(movies)
-    start = (page - 1) * per_page
-    end = start + per_page
-    page_items = movies[start:end]
+        page_items, total = unfiltered_page(sample_param, sort_by, order, page, per_page)
 
     return jsonify({
         "movies": page_items,
@@ -2,7 +2,7 @@ import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from tqdm import tqdm
-from recommender import PureSVDRecommender
+from recommender import PureSVDRecommender, index_in, top_k_indices
 
 K = 10
 THRESHOLD = 4.0
@@ -14,31 +14,33 @@ rec = PureSVDRecommender(sample_users=1000, sample_movies=1000)
 ratings = rec.ratings
 users = ratings['userId'].drop_duplicates().sample(n=SAMPLE_USERS, random_state=42)
 
+# Sort once so every user's ratings are a contiguous slice of plain NumPy arrays
+ratings_sorted = ratings.sort_values('userId', kind='stable').reset_index(drop=True)
+uid = ratings_sorted['userId'].values
+mid = index_in(rec.movie_ids_arr, ratings_sorted['movieId'].values)
+r = ratings_sorted['rating'].values.astype(np.float32)
+user_keys, user_starts, user_counts = np.unique(uid, return_index=True, return_counts=True)
+user_pos = np.searchsorted(user_keys, users.values)
+
 precisions = []
 
 print("⚙️  Running Precision@10 evaluation...")
-for user_id in tqdm(users):
-    user_ratings = ratings[ratings['userId'] == user_id]
-    if len(user_ratings) < 6:
+for pos in tqdm(user_pos):
+    start, count = user_starts[pos], user_counts[pos]
+    if count < 6:
         continue
 
-    train, test = train_test_split(user_ratings, test_size=0.4, random_state=42)
-    profile = np.zeros(rec.item_factors.shape[1], dtype=np.float32)  # Latent dim
-    for _, row in train.iterrows():
-        mid, r = row["movieId"], row["rating"]
-        if mid not in rec.id2idx_m:
-            continue
-        idx = rec.id2idx_m[mid]
-        profile += rec.item_factors[idx] * r
+    train_idx, test_idx = train_test_split(np.arange(start, start + count), test_size=0.4, random_state=42)
+    train_idx = train_idx[mid[train_idx] >= 0]
+    test_idx = test_idx[mid[test_idx] >= 0]
 
+    profile = rec.item_factors[mid[train_idx]].T @ r[train_idx]
     scores = rec.item_factors @ profile
-    rated_indices = [rec.id2idx_m[m] for m in train["movieId"] if m in rec.id2idx_m]
-    scores[rated_indices] = -np.inf
+    scores[mid[train_idx]] = -np.inf
 
-    top_indices = np.argsort(scores)[-K:][::-1]
-    top_ids = {rec.idx2id_m[i] for i in top_indices}
-    test_liked_ids = set(test[test["rating"] >= THRESHOLD]["movieId"])
-    hits = top_ids & test_liked_ids
+    top_indices = top_k_indices(scores, K)
+    test_liked = mid[test_idx[r[test_idx] >= THRESHOLD]]
+    hits = np.intersect1d(top_indices, test_liked)
     precision = len(hits) / K
     precisions.append(precision)
 
@@ -1,6 +1,9 @@
 import os
+import csv
 import time
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pandas as pd
@@ -14,15 +17,56 @@ TMDB_KEY = os.getenv("TMDB_API_KEY")
 TMDB_SEARCH = "https://api.themoviedb.org/3/search/movie"
 TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p/w500"
 PLACEHOLDER_URL = "/static/posters/placeholder.jpg"
-RATE_LIMIT_DELAY = 0.26
+RATE_LIMIT_REQUESTS = 40      # TMDB allows ~40 requests …
+RATE_LIMIT_WINDOW = 10.0      # … per 10 seconds
+MAX_WORKERS = 20
 
 if not TMDB_KEY:
     raise SystemExit("❌ TMDB_API_KEY not set in environment or .env file")
 
 
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cancelled: threading.Event) -> bool:
+        """Block until a token is available; False if `cancelled` is set while waiting."""
+        while not cancelled.is_set():
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            cancelled.wait(wait)
+        return False
+
+
+_bucket = TokenBucket(RATE_LIMIT_REQUESTS / RATE_LIMIT_WINDOW, RATE_LIMIT_REQUESTS / RATE_LIMIT_WINDOW)
+_local = threading.local()
+_cancelled = threading.Event()
+
+
+def _session() -> requests.Session:
+    # requests.Session is not thread-safe, so every worker keeps its own (and its own keep-alive pool)
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
 def fetch_tmdb_poster(title: str, year: str) -> str:
+    if not _bucket.acquire(_cancelled):
+        return PLACEHOLDER_URL
     try:
-        response = requests.get(
+        response = _session().get(
             TMDB_SEARCH,
             params={
                 "api_key": TMDB_KEY,
@@ -44,10 +88,17 @@ def fetch_tmdb_poster(title: str, year: str) -> str:
     return PLACEHOLDER_URL
 
 
+def poster_for(title: str, year: str) -> str:
+    if not title or not year:
+        return PLACEHOLDER_URL
+    return fetch_tmdb_poster(title, year)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", default="data/ml-25m/movies.csv", help="Original MovieLens movies.csv")
     parser.add_argument("--output", default="data/ml-25m/movies_with_posters.csv", help="Path to save results")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Concurrent TMDB requests")
     args = parser.parse_args()
 
     input_path = Path(args.input)
@@ -60,47 +111,45 @@ def main():
     df_all["title_clean"] = df_all["title_clean"].fillna("")
 
     # ─── Resume support: check for existing output ───────────────
-    if output_path.exists():
-        df_done = pd.read_csv(output_path)
-        done_ids = set(df_done["movieId"])
+    if output_path.exists() and output_path.stat().st_size > 0:
+        done_ids = set(pd.read_csv(output_path, usecols=["movieId"])["movieId"])
+        write_header = False
         print(f"🔁 Resuming from previous file. {len(done_ids)} already fetched.")
     else:
-        df_done = pd.DataFrame()
         done_ids = set()
+        write_header = True
 
     # ─── Filter out already processed movies ─────────────────────
     df_remaining = df_all[~df_all["movieId"].isin(done_ids)].copy()
     print(f"📦 Fetching posters for {len(df_remaining)} remaining movies…")
 
     # ─── Main fetch loop ─────────────────────────────────────────
-    poster_rows = []
-    for _, row in tqdm(df_remaining.iterrows(), total=len(df_remaining)):
-        movie_id = int(row["movieId"])
-        title = row["title_clean"].strip()
-        year = row["year"].strip()
-
-        if not title or not year:
-            poster_url = PLACEHOLDER_URL
-        else:
-            poster_url = fetch_tmdb_poster(title, year)
-            time.sleep(RATE_LIMIT_DELAY)
-
-        new_row = row.drop(labels=["title_clean"]).copy()
-        new_row["posterUrl"] = poster_url
-        poster_rows.append(new_row)
-
-        # Write batch every 100 movies to avoid data loss
-        if len(poster_rows) % 100 == 0:
-            batch_df = pd.DataFrame(poster_rows)
-            df_done = pd.concat([df_done, batch_df], ignore_index=True)
-            df_done.to_csv(output_path, index=False)
-            poster_rows = []
-
-    # ─── Final write ─────────────────────────────────────────────
-    if poster_rows:
-        batch_df = pd.DataFrame(poster_rows)
-        df_done = pd.concat([df_done, batch_df], ignore_index=True)
-        df_done.to_csv(output_path, index=False)
+    # Requests overlap across worker threads; the token bucket keeps us under TMDB's rate limit.
+    # Rows are appended as they arrive, so checkpointing never rewrites what is already on disk.
+    out_columns = [c for c in df_all.columns if c != "title_clean"]
+    titles = df_remaining["title_clean"].str.strip()
+    years = df_remaining["year"].str.strip()
+    with open(output_path, "a", newline="", encoding="utf-8") as fout, \
+            ThreadPoolExecutor(max_workers=args.workers) as pool:
+        writer = csv.writer(fout, lineterminator="\n")
+        if write_header:
+            writer.writerow(out_columns + ["posterUrl"])
+        poster_urls = pool.map(poster_for, titles, years)
+        rows = df_remaining[out_columns].itertuples(index=False, name=None)
+        try:
+            for n, (row, poster_url) in enumerate(tqdm(zip(rows, poster_urls), total=len(df_remaining)), 1):
+                writer.writerow([*row, poster_url])
+
+                # Flush every 100 movies to avoid data loss
+                if n % 100 == 0:
+                    fout.flush()
+        except BaseException:
+            # map() has already queued every remaining lookup; drop them and release the
+            # workers waiting on the rate limiter, so Ctrl-C or a write error stops after the
+            # requests already on the wire instead of fetching results nobody writes
+            _cancelled.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
 
     print(f"✅ Complete! Saved to: {args.output}")
 
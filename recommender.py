@@ -1,13 +1,100 @@
+import os
+import re
+import zipfile
+from abc import ABC, abstractmethod
 import numpy as np
 import pandas as pd
 from pathlib import Path
 from typing import List, Dict
-from scipy.sparse import csr_matrix
-from sklearn.decomposition import TruncatedSVD
+from scipy.sparse import csr_matrix, load_npz, save_npz
+from sklearn.utils.extmath import randomized_svd
 
 PLACEHOLDER_URL = "/static/posters/placeholder.jpg"
+CACHE_VERSION = 2  # bump whenever the way the matrix or factors are built changes
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the whole array."""
+    k = min(k, scores.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(scores, -k)[-k:]
+    return idx[np.argsort(scores[idx])[::-1]]
+
+
+def index_in(sorted_ids: np.ndarray, query) -> np.ndarray:
+    """Positions of the `query` ids in the sorted array `sorted_ids`, -1 where an id is absent."""
+    query = np.asarray(query)
+    idx = np.searchsorted(sorted_ids, query)
+    idx[idx == len(sorted_ids)] = 0
+    return np.where(sorted_ids[idx] == query, idx, -1)
+
+
+def _write_atomic(path: Path, write):
+    """Write through a temp file and rename it into place, so readers (and existing
+    memory maps) never see a half-written file when several workers build at once."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _bool_array(flags: List[bool]) -> np.ndarray:
+    # bytes() packs Python bools in C; np.array(flags) converts them one object at a time
+    return np.frombuffer(bytes(flags), dtype=bool)
+
+
+class SubstringIndex:
+    """Substring search over a fixed list of strings, picking the cheapest scan per query.
+
+    The strings are also joined into one contiguous buffer: a selective query is a
+    single C-level re.finditer pass that only touches Python for the matches. Very
+    common queries and small candidate sets fall back to a per-row `in` test, which
+    is cheaper when most rows match or few rows are left to check.
+    """
+
+    SEP = "\0"
+    PROBE_FRACTION = 16  # share of the buffer sampled to estimate how common a query is
+
+    def __init__(self, strings):
+        self.strings = list(strings)
+        self.size = len(self.strings)
+        self.blob = self.SEP.join(self.strings)
+        lengths = np.fromiter((len(x) + 1 for x in self.strings), dtype=np.int64, count=self.size)
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    def contains(self, query: str, positions: np.ndarray) -> np.ndarray:
+        """The subset of `positions` whose string contains `query`, in the same order."""
+        if self.SEP in query:
+            return positions[:0]
+        if len(positions) * 8 < self.size:
+            # Few candidates left (e.g. after the year filter): test only those rows
+            strings = self.strings
+            keep = _bool_array([query in strings[i] for i in positions.tolist()])
+            return positions[keep]
+
+        probe = self.blob.count(query, 0, len(self.blob) // self.PROBE_FRACTION)
+        if probe * self.PROBE_FRACTION * 8 > self.size:
+            # Matches in an eighth of the rows or more: one Python object per match would
+            # cost more than testing every row directly
+            mask = _bool_array([query in x for x in self.strings])
+        else:
+            hits = np.fromiter((m.start() for m in re.finditer(re.escape(query), self.blob)), dtype=np.int64)
+            mask = np.zeros(self.size, dtype=bool)
+            mask[np.searchsorted(self.starts, hits, side="right") - 1] = True
+        return positions[mask[positions]]
+
+
+class BaseRecommender(ABC):
+    """Data loading, movie catalog and metadata shared by every recommender backend.
+
+    Subclasses build their model in __init__ after calling super().__init__()
+    and implement recommend_for_new_user().
+    """
 
-class PureSVDRecommender:
     def __init__(self, root: str = "data/ml-25m", sample_users=5000, sample_movies=5000):
         self.root = Path(root)
         print("⚙️  Loading ratings and movies ...")
@@ -15,56 +102,45 @@ class PureSVDRecommender:
         self.movies = self._load_movies()
         self.movie_ids = sorted(self.ratings["movieId"].unique())
         self.user_ids = sorted(self.ratings["userId"].unique())
+        # Sorted arrays for vectorized id -> index mapping; id2idx_m stays for single lookups
+        self.movie_ids_arr = np.asarray(self.movie_ids)
+        self.user_ids_arr = np.asarray(self.user_ids)
 
         self.id2idx_m = {mid: i for i, mid in enumerate(self.movie_ids)}
-        self.idx2id_m = {i: mid for mid, i in self.id2idx_m.items()}
-        self.id2idx_u = {uid: i for i, uid in enumerate(self.user_ids)}
-
-        print("⚙️  Creating user-item matrix ...")
-        rows = self.ratings["userId"].map(self.id2idx_u).values
-        cols = self.ratings["movieId"].map(self.id2idx_m).values
-        data = self.ratings["rating"].values.astype(np.float32)
-
-        self.matrix = csr_matrix((data, (rows, cols)), shape=(len(self.user_ids), len(self.movie_ids)))
-        print("⚙️  Computing SVD ...")
-        self.svd = TruncatedSVD(n_components=50, random_state=42)
-        self.user_factors = self.svd.fit_transform(self.matrix)
-        self.item_factors = self.svd.components_.T
-        print("✅ PureSVD ready:", self.matrix.shape)
 
         self.movies.set_index("movieId", inplace=True)
-        self.avg_rating = self.ratings.groupby("movieId")["rating"].mean().round(2)
 
-    def recommend_for_new_user(self, rating_list, top_n=10, min_rated=6):
-        if len(rating_list) < min_rated:
-            raise ValueError(f"Need at least {min_rated} ratings")
+        # Per-movie mean rating, indexed like movie_ids: two bincount passes instead of a groupby
+        cols = np.searchsorted(self.movie_ids_arr, self.ratings["movieId"].values)
+        counts = np.bincount(cols, minlength=len(self.movie_ids))
+        sums = np.bincount(cols, weights=self.ratings["rating"].values, minlength=len(self.movie_ids))
+        self.avg_rating_arr = (sums / np.maximum(counts, 1)).round(2)
 
-        user_profile = np.zeros(self.item_factors.shape[1])
-        for r in rating_list:
-            mid, rating = r["movieId"], r["rating"]
-            if mid not in self.id2idx_m:
-                continue
-            idx = self.id2idx_m[mid]
-            user_profile += self.item_factors[idx] * rating
+        # Plain-dict views so _meta_for avoids pandas label indexing per movie
+        self.movies_records = self.movies.to_dict(orient="index")
+        self.avg_rating_d = dict(zip(self.movie_ids, self.avg_rating_arr.tolist()))
+        self._build_catalog()
 
-        scores = self.item_factors @ user_profile
-        rated_indices = [self.id2idx_m[r["movieId"]] for r in rating_list if r["movieId"] in self.id2idx_m]
-        scores[rated_indices] = -np.inf
+    @abstractmethod
+    def recommend_for_new_user(self, rating_list, top_n=10, min_rated=6) -> List[Dict]:
+        """Top-N movie metadata (with a "score" field) for a user given only their ratings."""
 
-        top_indices = np.argsort(scores)[-top_n:][::-1]
-        top_ids = [self.idx2id_m[i] for i in top_indices]
-        return self._meta_for(top_ids, scores=scores[top_indices])
+    def all_positions(self) -> np.ndarray:
+        return np.arange(len(self.catalog_ids))
 
-    def sample_movies(self, n: int = 150, seed: int = 42):
+    def sample_positions(self, n: int = 150, seed: int = 42) -> np.ndarray:
         rng = np.random.default_rng(seed)
         ids = rng.choice(self.movie_ids, size=n, replace=False)
-        return self._meta_for(ids)
+        positions = index_in(self.catalog_ids, ids)
+        return positions[positions >= 0]
 
-    def all_movies(self):
-        return self._meta_for(self.movie_ids)
+    def page(self, positions, start: int, end: int) -> List[Dict]:
+        """Metadata for positions[start:end]; rows outside the page never become dicts."""
+        return self._meta_for(self.catalog_ids[positions[start:end]])
 
     def _load_ratings(self, max_users, max_movies):
-        df = pd.read_csv(self.root / "ratings.csv", usecols=["userId", "movieId", "rating"])
+        # The pyarrow engine parses multithreaded; the default C parser is single-threaded on 25M rows
+        df = pd.read_csv(self.root / "ratings.csv", usecols=["userId", "movieId", "rating"], engine="pyarrow")
         users = df["userId"].unique()[:max_users]
         df = df[df["userId"].isin(users)]
         movies = df["movieId"].unique()[:max_movies]
@@ -77,23 +153,149 @@ class PureSVDRecommender:
         df = df[df["year"].astype(str).str.strip() != ""]
         df = df[df["genres"].str.strip() != ""]
         df = df[df["posterUrl"].str.startswith("http")]
-        return df[["movieId", "title", "year", "genres", "posterUrl"]]
+        # Lowercased / parsed once here so search never has to do it per request
+        df = df.assign(
+            title_lc=df["title"].str.lower(),
+            genres_lc=df["genres"].str.lower(),
+            year_int=pd.to_numeric(df["year"], errors="coerce").fillna(0).astype(np.int32),
+        )
+        return df[["movieId", "title", "year", "genres", "posterUrl", "title_lc", "genres_lc", "year_int"]]
+
+    def _build_catalog(self):
+        # Column arrays (one entry per listable movie, in movie_ids order) so /api/movies
+        # can filter and sort with vectorized masks instead of walking a list of dicts.
+        in_catalog = np.isin(self.movie_ids_arr, self.movies.index.values)
+        self.catalog_ids = self.movie_ids_arr[in_catalog]
+        df = self.movies.loc[self.catalog_ids]
+        self.title_search = SubstringIndex(df["title_lc"].tolist())
+        self.genre_search = SubstringIndex(df["genres_lc"].tolist())
+        self.years = df["year_int"].to_numpy()
+        self.avg_ratings = self.avg_rating_arr[in_catalog]
+
+        # Every (sort key, order) permutation is computed once here; requests only select from it.
+        # sort_perms[k] lists catalog positions in sorted order, sort_ranks[k] is its inverse.
+        # Descending orders sort negated ranks so ties keep catalog order, as list.sort(reverse=True) did.
+        self.sort_perms, self.sort_ranks = {}, {}
+        sort_keys = {"rating": self.avg_ratings, "year": self.years, "title": df["title_lc"].to_numpy(dtype=object)}
+        for key, values in sort_keys.items():
+            ranks = np.unique(values, return_inverse=True)[1].ravel()
+            for order, sort_on in (("asc", ranks), ("desc", -ranks)):
+                perm = np.argsort(sort_on, kind="stable")
+                inverse = np.empty_like(perm)
+                inverse[perm] = np.arange(len(perm))
+                self.sort_perms[key, order] = perm
+                self.sort_ranks[key, order] = inverse
 
     def _meta_for(self, movie_ids, scores=None):
         rows = []
         for i, mid in enumerate(movie_ids):
-            if mid not in self.movies.index:
+            m = self.movies_records.get(mid)
+            if m is None:
                 continue
-            m = self.movies.loc[mid]
             item = {
                 "movieId": int(mid),
                 "title": m["title"],
                 "year": m["year"],
                 "genres": m["genres"],
-                "avgRating": float(self.avg_rating.get(mid, 0)),
+                "avgRating": float(self.avg_rating_d.get(mid, 0)),
                 "posterUrl": m["posterUrl"] or PLACEHOLDER_URL,
             }
             if scores is not None:
                 item["score"] = float(scores[i])
             rows.append(item)
         return rows
+
+
+class PureSVDRecommender(BaseRecommender):
+    def __init__(self, root: str = "data/ml-25m", sample_users=5000, sample_movies=5000):
+        super().__init__(root, sample_users, sample_movies)
+
+        cache_files = self._cache_files(sample_users, sample_movies)
+        if self._load_model_cache(cache_files):
+            print("⚙️  Loaded user-item matrix and SVD factors from cache")
+        else:
+            print("⚙️  Creating user-item matrix ...")
+            rows = np.searchsorted(self.user_ids_arr, self.ratings["userId"].values)
+            cols = np.searchsorted(self.movie_ids_arr, self.ratings["movieId"].values)
+            data = self.ratings["rating"].values.astype(np.float32)
+
+            self.matrix = csr_matrix((data, (rows, cols)), shape=(len(self.user_ids), len(self.movie_ids)))
+            print("⚙️  Computing SVD ...")
+            # Two QR-normalized power iterations are enough for the top 50 singular vectors;
+            # every iteration is a full pass over the sparse matrix
+            U, S, Vt = randomized_svd(self.matrix, n_components=50, n_iter=2,
+                                      power_iteration_normalizer="QR", random_state=42)
+            self.user_factors = U * S
+            # Row-major float32 so scoring gathers contiguous rows and runs single-precision GEMV
+            self.item_factors = np.ascontiguousarray(Vt.T, dtype=np.float32)
+            self._save_model_cache(cache_files)
+        print("✅ PureSVD ready:", self.matrix.shape)
+
+    def recommend_for_new_user(self, rating_list, top_n=10, min_rated=6):
+        if len(rating_list) < min_rated:
+            raise ValueError(f"Need at least {min_rated} ratings")
+
+        known = [r for r in rating_list if r["movieId"] in self.id2idx_m]
+        rated_indices = np.array([self.id2idx_m[r["movieId"]] for r in known], dtype=np.int64)
+        rated_values = np.array([r["rating"] for r in known], dtype=np.float32)
+
+        # One GEMV over the rated rows instead of accumulating a profile per rating
+        user_profile = self.item_factors[rated_indices].T @ rated_values
+
+        scores = self.item_factors @ user_profile
+        scores[rated_indices] = -np.inf
+
+        top_indices = top_k_indices(scores, top_n)
+        top_ids = self.movie_ids_arr[top_indices]
+        return self._meta_for(top_ids, scores=scores[top_indices])
+
+    def _cache_files(self, sample_users, sample_movies):
+        stem = f"puresvd_v{CACHE_VERSION}_u{sample_users}_m{sample_movies}"
+        cache_dir = self.root / "cache"
+        return {
+            "user_item": cache_dir / f"{stem}_user_item.npz",
+            "user_factors": cache_dir / f"{stem}_user_factors.npy",
+            "item_factors": cache_dir / f"{stem}_item_factors.npy",
+            # Written last, so its presence marks a complete cache
+            "ids": cache_dir / f"{stem}_ids.npz",
+        }
+
+    def _load_model_cache(self, files) -> bool:
+        if not all(path.exists() for path in files.values()):
+            return False
+        if min(path.stat().st_mtime for path in files.values()) < (self.root / "ratings.csv").stat().st_mtime:
+            return False
+        # A truncated or corrupt file just means the model gets rebuilt
+        try:
+            with np.load(files["ids"]) as ids:
+                if not (np.array_equal(ids["movie_ids"], self.movie_ids) and np.array_equal(ids["user_ids"], self.user_ids)):
+                    return False
+            matrix = load_npz(files["user_item"]).tocsr()
+            # Memory-mapped so several worker processes share one copy of the factors
+            user_factors = np.load(files["user_factors"], mmap_mode="r")
+            item_factors = np.load(files["item_factors"], mmap_mode="r")
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile) as e:
+            print(f"⚠️  Ignoring unreadable model cache: {e}")
+            return False
+        shape = (len(self.user_ids), len(self.movie_ids))
+        if matrix.shape != shape or len(user_factors) != shape[0] or len(item_factors) != shape[1]:
+            return False
+        self.matrix, self.user_factors, self.item_factors = matrix, user_factors, item_factors
+        return True
+
+    def _save_model_cache(self, files):
+        try:
+            files["ids"].parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(files["user_item"], lambda f: save_npz(f, self.matrix))
+            _write_atomic(files["user_factors"], lambda f: np.save(f, self.user_factors))
+            _write_atomic(files["item_factors"], lambda f: np.save(f, self.item_factors))
+            _write_atomic(files["ids"], lambda f: np.savez(f, movie_ids=np.asarray(self.movie_ids),
+                                                           user_ids=np.asarray(self.user_ids)))
+        except OSError as e:
+            print(f"⚠️  Could not write model cache: {e}")
+
+
+# Backends app.py can serve, selected by the BACKEND environment variable
+BACKENDS = {
+    "svd": PureSVDRecommender,
+}